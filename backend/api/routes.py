@@ -1,8 +1,12 @@
+import hashlib
 import secrets
+import time
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from starlette.status import HTTP_201_CREATED
+from starlette.status import HTTP_201_CREATED, HTTP_204_NO_CONTENT
 
 from backend.api.schemas import (
     MetricIn,
@@ -11,19 +15,135 @@ from backend.api.schemas import (
     ProbeBootstrapRequest,
     ProbeBootstrapResponse,
     ProbeCreate,
+    ProbeLatest,
     ProbeOut,
     ServerCreate,
     ServerOut,
+    ServerPage,
+    ServerSummary,
 )
 from backend.database.db import get_db
 from backend.models.models import Metric, Probe, Server
+from backend.websocket.server import (
+    fleet,
+    forget_server,
+    ingest_sample,
+    latest_state,
+    probe_state,
+)
 
 router = APIRouter(prefix="/api")
 
 
-@router.get("/servers", response_model=list[ServerOut])
-def list_servers(db: Session = Depends(get_db)):
-    return db.query(Server).all()
+SERVER_STATUSES = ("online", "offline", "pending")
+
+
+def _etag(parts: List) -> str:
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _not_modified(etag: str, if_none_match: Optional[str]) -> bool:
+    if not if_none_match:
+        return False
+    return etag in {tag.strip() for tag in if_none_match.split(",")} or if_none_match.strip() == "*"
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _server_summary(server: Server, status: str, include_latest: bool) -> ServerSummary:
+    state = latest_state.get(server.id) or {}
+    return ServerSummary(
+        id=server.id,
+        name=server.name,
+        owner_id=server.owner_id,
+        status=status,
+        online=status == "online",
+        latest=state.get("data") if include_latest else None,
+        latest_timestamp=state.get("timestamp"),
+    )
+
+
+@router.get("/servers", response_model=ServerPage)
+def list_servers(
+    response: Response,
+    name: Optional[str] = None,
+    status: Optional[str] = None,
+    owner_id: Optional[int] = None,
+    online: Optional[bool] = None,
+    include_latest: bool = True,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
+    if status is not None and status not in SERVER_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {SERVER_STATUSES}")
+    now = time.time()
+    query = db.query(Server)
+    if name:
+        query = query.filter(Server.name.ilike(f"%{_escape_like(name)}%", escape="\\"))
+    if owner_id is not None:
+        query = query.filter(Server.owner_id == owner_id)
+
+    # 在线判定与 FleetSummary 一致，都以最近一次上报（Probe.last_seen）为准
+    recent = select(Probe.server_id).where(Probe.last_seen >= fleet.online_cutoff())
+    reported = select(Probe.server_id).where(Probe.last_seen.isnot(None))
+    if status == "online" or online is True:
+        query = query.filter(Server.id.in_(recent))
+    if status == "offline":
+        query = query.filter(Server.id.in_(reported), Server.id.notin_(recent))
+    if status == "pending":
+        query = query.filter(Server.id.notin_(reported))
+    if online is False:
+        query = query.filter(Server.id.notin_(recent))
+
+    total = query.count()
+    servers = query.order_by(Server.name, Server.id).offset(offset).limit(limit).all()
+    statuses = [fleet.status(server.id, now) for server in servers]
+
+    # ETag 只取决于本页服务器各自的版本与状态，其他服务器上报不会使其失效；
+    # 命中时跳过指标序列化
+    etag = _etag(
+        [fleet.started, fleet.version, name, status, owner_id, online, include_latest]
+        + [offset, limit, total]
+        + [
+            (server.id, fleet.server_version(server.id), st)
+            for server, st in zip(servers, statuses)
+        ]
+    )
+    if _not_modified(etag, if_none_match):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return ServerPage(
+        items=[
+            _server_summary(server, st, include_latest) for server, st in zip(servers, statuses)
+        ],
+        total=total,
+        offset=offset,
+        limit=limit,
+    )
+
+
+@router.get("/servers/{server_id}", response_model=ServerSummary)
+def get_server(
+    server_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
+    # 只取决于这一台服务器的版本与状态，命中时不查库
+    status = fleet.status(server_id)
+    etag = _etag([fleet.started, server_id, fleet.server_version(server_id), status])
+    if _not_modified(etag, if_none_match):
+        return Response(status_code=304, headers={"ETag": etag})
+    server = db.query(Server).filter(Server.id == server_id).first()
+    if not server:
+        raise HTTPException(status_code=404, detail="server not found")
+    response.headers["ETag"] = etag
+    return _server_summary(server, status, include_latest=True)
 
 
 @router.post("/servers", response_model=ServerOut, status_code=HTTP_201_CREATED)
@@ -32,9 +152,23 @@ def create_server(server: ServerCreate, db: Session = Depends(get_db)):
     db.add(item)
     db.commit()
     db.refresh(item)
+    fleet.bump()
     return item
 
 
+@router.delete("/servers/{server_id}", status_code=HTTP_204_NO_CONTENT)
+def delete_server(server_id: str, db: Session = Depends(get_db)):
+    server = db.query(Server).filter(Server.id == server_id).first()
+    if not server:
+        raise HTTPException(status_code=404, detail="server not found")
+    db.query(Metric).filter(Metric.server_id == server_id).delete(synchronize_session=False)
+    db.query(Probe).filter(Probe.server_id == server_id).delete(synchronize_session=False)
+    db.delete(server)
+    db.commit()
+    forget_server(server_id)
+    return Response(status_code=HTTP_204_NO_CONTENT)
+
+
 @router.post("/probes", response_model=ProbeOut, status_code=HTTP_201_CREATED)
 def create_probe(probe: ProbeCreate, db: Session = Depends(get_db)):
     server = db.query(Server).filter(Server.id == probe.server_id).first()
@@ -47,6 +181,15 @@ def create_probe(probe: ProbeCreate, db: Session = Depends(get_db)):
     return item
 
 
+@router.get("/servers/{server_id}/probes/latest", response_model=list[ProbeLatest])
+def get_probe_latest(server_id: str):
+    # 入库时按服务器去重，这里保留每个在线探针各自的最近一次上报
+    return [
+        ProbeLatest(probe_id=pid, **state)
+        for pid, state in probe_state.get(server_id, {}).items()
+    ]
+
+
 @router.get("/metrics/{server_id}", response_model=MetricsList)
 def get_metrics(server_id: str, limit: int = 50, db: Session = Depends(get_db)):
     rows = (
@@ -60,19 +203,14 @@ def get_metrics(server_id: str, limit: int = 50, db: Session = Depends(get_db)):
 
 
 @router.post("/metrics", response_model=MetricOut, status_code=HTTP_201_CREATED)
-def add_metric(metric: MetricIn, db: Session = Depends(get_db)):
+async def add_metric(metric: MetricIn, db: Session = Depends(get_db)):
     probe = db.query(Probe).filter(Probe.id == metric.probe_id).first()
     if not probe:
         raise HTTPException(status_code=404, detail="probe not found")
-    item = Metric(
-        server_id=metric.server_id,
-        probe_id=metric.probe_id,
-        timestamp=metric.timestamp,
-        metrics_json=metric.data,
-    )
-    db.add(item)
-    db.commit()
-    db.refresh(item)
+    if metric.server_id != probe.server_id:
+        raise HTTPException(status_code=400, detail="probe does not belong to server")
+    # 与 WebSocket 上报走同一路径：去重、更新在线状态并推送
+    item, _ = await ingest_sample(probe, metric.timestamp, metric.data, db)
     return item
 
 
@@ -88,6 +226,7 @@ def _ensure_server(payload: ProbeBootstrapRequest, db: Session) -> Server:
     db.add(server)
     db.commit()
     db.refresh(server)
+    fleet.bump()
     return server
 
 
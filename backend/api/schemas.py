@@ -18,6 +18,23 @@ class ServerOut(BaseModel):
         orm_mode = True
 
 
+class ServerSummary(BaseModel):
+    id: str
+    name: str
+    owner_id: Optional[int] = None
+    status: str
+    online: bool
+    latest: Optional[Dict[str, Any]] = None
+    latest_timestamp: Optional[str] = None
+
+
+class ServerPage(BaseModel):
+    items: List[ServerSummary]
+    total: int
+    offset: int
+    limit: int
+
+
 class ProbeCreate(BaseModel):
     server_id: str
     api_key: str = Field(..., min_length=6)
@@ -33,6 +50,13 @@ class ProbeOut(BaseModel):
         orm_mode = True
 
 
+class ProbeLatest(BaseModel):
+    probe_id: str
+    server_id: str
+    data: Dict[str, Any]
+    timestamp: Optional[str] = None
+
+
 class MetricIn(BaseModel):
     server_id: str
     probe_id: str
@@ -1,10 +1,12 @@
 import uvicorn
 from fastapi import Depends, FastAPI, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from backend.api import routes
-from backend.database.db import Base, engine, get_db
+from backend.database.db import Base, SessionLocal, engine, get_db
+from backend.models.models import Probe
 from backend.websocket import server as ws_server
 
 Base.metadata.create_all(bind=engine)
@@ -23,6 +25,18 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+def seed_fleet_summary():
+    # 重启后以 last_seen 恢复在线汇总，离线的服务器显示为 offline 而不是 pending
+    db = SessionLocal()
+    try:
+        ws_server.fleet.seed(
+            db.query(Probe.server_id, func.max(Probe.last_seen)).group_by(Probe.server_id).all()
+        )
+    finally:
+        db.close()
+
+
 @app.websocket("/ws/probe")
 async def probe_ws(websocket: WebSocket, db: Session = Depends(get_db)):
     await ws_server.probe_socket(websocket, db)
@@ -39,7 +39,8 @@ class Probe(Base):
     id = Column(String(36), primary_key=True, default=default_uuid)
     server_id = Column(String(36), ForeignKey("servers.id"), nullable=False)
     api_key = Column(String(64), unique=True, nullable=False, index=True)
-    last_seen = Column(DateTime, default=dt.datetime.utcnow, nullable=True)
+    # 仅在收到上报时写入；为空表示从未上报
+    last_seen = Column(DateTime, nullable=True)
 
     server = relationship("Server", back_populates="probes")
     metrics = relationship("Metric", back_populates="probe", order_by="desc(Metric.timestamp)")
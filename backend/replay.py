@@ -0,0 +1,397 @@
+"""回放历史指标：把 Metric 记录或导出的 NDJSON 按 N 倍速经 /ws/probe 重新上报。
+
+回放前在目标控制面上通过 REST 临时创建服务器与探针（不复用真实 api_key），
+每个历史探针可扇出为 ``--clones`` 个模拟探针，每个模拟探针一个并发连接，
+按原始时间间隔（除以倍速）发送样本，统计发送到收到 ack 的端到端耗时。
+结束后删除临时服务器（``--keep`` 保留并打印其 id）。回放会写入目标控制面的数据库，请指向测试实例。
+
+样本按时间顺序流式读取并分发到每个探针的有界队列，内存占用与探针数成正比，
+与历史长度无关；因此 NDJSON 需按 timestamp 升序（``--export`` 的输出即是如此）。
+
+NDJSON 每行一条：{"probe_id", "server_id", "timestamp", "data"}。
+
+    python -m backend.replay --export metrics.ndjson --server-id <uuid>
+    python -m backend.replay --url ws://127.0.0.1:8000/ws/probe --input metrics.ndjson --speed 10 --clones 5
+"""
+import argparse
+import asyncio
+import collections
+import datetime as dt
+import json
+import random
+import secrets
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import websockets
+
+from backend.database.db import SessionLocal
+from backend.models.models import Metric
+
+# 每个模拟探针队列中最多缓存的样本数，读取端在队列满时等待
+QUEUE_SIZE = 256
+# 每次从数据源（线程中）取出的样本数
+READ_BATCH = 500
+# 用于估算延迟分位数的抽样上限
+RESERVOIR_SIZE = 100_000
+
+Key = Tuple[str, str]  # (server_id, probe_id)
+
+
+def _db_query(db, server_id: Optional[str], since: Optional[dt.datetime], limit: Optional[int]):
+    query = db.query(Metric.probe_id, Metric.server_id, Metric.timestamp, Metric.metrics_json)
+    if server_id:
+        query = query.filter(Metric.server_id == server_id)
+    if since:
+        query = query.filter(Metric.timestamp >= since)
+    query = query.order_by(Metric.timestamp)
+    if limit:
+        query = query.limit(limit)
+    return query
+
+
+def _iter_db(
+    server_id: Optional[str], since: Optional[dt.datetime], limit: Optional[int]
+) -> Iterator[Dict]:
+    db = SessionLocal()
+    try:
+        # 分批拉取，避免把整段历史一次性读入内存
+        query = _db_query(db, server_id, since, limit)
+        for probe_id, sid, timestamp, data in query.yield_per(1000):
+            yield {
+                "probe_id": probe_id,
+                "server_id": sid,
+                "timestamp": timestamp.isoformat(),
+                "data": data,
+            }
+    finally:
+        db.close()
+
+
+def _db_keys(
+    server_id: Optional[str], since: Optional[dt.datetime], limit: Optional[int]
+) -> Set[Key]:
+    db = SessionLocal()
+    try:
+        sub = _db_query(db, server_id, since, limit).subquery()
+        return set(db.query(sub.c.server_id, sub.c.probe_id).distinct().all())
+    finally:
+        db.close()
+
+
+def _iter_ndjson(
+    path: str,
+    server_id: Optional[str],
+    since: Optional[dt.datetime],
+    limit: Optional[int],
+) -> Iterator[Dict]:
+    since_epoch = _epoch(since.isoformat()) if since else None
+    count = 0
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            sample = json.loads(line)
+            if server_id and sample["server_id"] != server_id:
+                continue
+            if since_epoch is not None and _epoch(sample["timestamp"]) < since_epoch:
+                continue
+            yield sample
+            count += 1
+            if limit and count >= limit:
+                return
+
+
+def _export(samples: Iterator[Dict], path: str) -> int:
+    count = 0
+    with open(path, "w", encoding="utf-8") as fh:
+        for sample in samples:
+            fh.write(json.dumps(sample, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def _epoch(timestamp: str) -> float:
+    ts = dt.datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=dt.timezone.utc)
+    return ts.timestamp()
+
+
+def _api_base(ws_url: str) -> str:
+    parts = urllib.parse.urlsplit(ws_url)
+    scheme = "https" if parts.scheme == "wss" else "http"
+    return f"{scheme}://{parts.netloc}"
+
+
+def _request(method: str, url: str, payload: Optional[Dict] = None) -> Optional[Dict]:
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode("utf-8") if payload is not None else None,
+        headers={"Content-Type": "application/json"},
+        method=method,
+    )
+    with urllib.request.urlopen(request, timeout=30) as resp:
+        body = resp.read()
+    return json.loads(body) if body else None
+
+
+def _provision(
+    api_base: str, keys: Set[Key], clones: int, workers: int = 16
+) -> Tuple[Dict[Key, List[str]], List[str]]:
+    """在目标控制面上为每个历史服务器创建 ``clones`` 台临时服务器，探针一一对应。
+
+    返回 (历史探针 -> 模拟探针 api_key 列表, 创建的服务器 id)。
+    """
+    server_jobs = [(sid, k) for sid in sorted({sid for sid, _ in keys}) for k in range(clones)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        created = list(
+            pool.map(
+                lambda job: _request(
+                    "POST", f"{api_base}/api/servers", {"name": f"replay-{job[0][:8]}-{job[1]}"}
+                )["id"],
+                server_jobs,
+            )
+        )
+        mapping = dict(zip(server_jobs, created))
+
+        probe_jobs = [
+            (key, mapping[(key[0], k)], secrets.token_hex(16))
+            for key in sorted(keys)
+            for k in range(clones)
+        ]
+        list(
+            pool.map(
+                lambda job: _request(
+                    "POST", f"{api_base}/api/probes", {"server_id": job[1], "api_key": job[2]}
+                ),
+                probe_jobs,
+            )
+        )
+    api_keys: Dict[Key, List[str]] = {}
+    for key, _, api_key in probe_jobs:
+        api_keys.setdefault(key, []).append(api_key)
+    return api_keys, created
+
+
+def _teardown(api_base: str, server_ids: List[str], workers: int = 16) -> None:
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(
+            pool.map(
+                lambda sid: _request("DELETE", f"{api_base}/api/servers/{sid}"), server_ids
+            )
+        )
+
+
+async def _send_samples(
+    url: str,
+    api_key: str,
+    queue: asyncio.Queue,
+    t0: List[Optional[float]],
+    start: List[Optional[float]],
+    speed: float,
+    stats: Dict,
+) -> bool:
+    """从队列取样本并发送，读到结束标记返回 True；鉴权失败返回 False。"""
+    async with websockets.connect(url, max_size=None) as ws:
+        await ws.send(json.dumps({"type": "auth", "api_key": api_key}))
+        auth = json.loads(await ws.recv())
+        if auth.get("type") != "auth_ok":
+            stats["auth_failed"] += 1
+            return False
+        while True:
+            item = await queue.get()
+            if item is None:
+                return True
+            t, data = item
+            if speed > 0:
+                due = start[0] + (t - t0[0]) / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    stats["max_lag"] = max(stats["max_lag"], -delay)
+            sent = time.perf_counter()
+            # 不带原始 timestamp：服务端按当前时间入库，与真实探针行为一致
+            await ws.send(json.dumps({"type": "metrics", "data": data}))
+            ack = json.loads(await ws.recv())
+            _record_latency(stats, time.perf_counter() - sent)
+            if ack.get("merged"):
+                stats["merged"] += 1
+
+
+async def _replay_probe(url: str, api_key: str, queue: asyncio.Queue, *args) -> None:
+    finished = False
+    try:
+        finished = await _send_samples(url, api_key, queue, *args)
+    finally:
+        # 发送端提前退出（鉴权失败、连接异常）时继续消费队列直到结束标记，避免读取端阻塞
+        if not finished:
+            while await queue.get() is not None:
+                pass
+
+
+def _take(it: Iterator[Dict], size: int) -> List[Dict]:
+    batch = []
+    for sample in it:
+        batch.append(sample)
+        if len(batch) >= size:
+            break
+    return batch
+
+
+def _record_latency(stats: Dict, latency: float) -> None:
+    # 蓄水池抽样估算分位数，内存不随样本数增长
+    stats["count"] += 1
+    stats["max_latency"] = max(stats["max_latency"], latency)
+    reservoir = stats["latency"]
+    if len(reservoir) < RESERVOIR_SIZE:
+        reservoir.append(latency)
+    else:
+        index = random.randrange(stats["count"])
+        if index < RESERVOIR_SIZE:
+            reservoir[index] = latency
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+async def replay(
+    url: str,
+    samples: Callable[[], Iterator[Dict]],
+    api_keys: Dict[Key, List[str]],
+    speed: float,
+) -> Dict:
+    queues: Dict[Key, List[asyncio.Queue]] = {
+        key: [asyncio.Queue(maxsize=QUEUE_SIZE) for _ in keys] for key, keys in api_keys.items()
+    }
+    stats = {
+        "count": 0,
+        "latency": [],
+        "max_latency": 0.0,
+        "max_lag": 0.0,
+        "merged": 0,
+        "auth_failed": 0,
+    }
+    # 以第一条样本的时间为回放零点，由读取端在分发前确定
+    t0: List[Optional[float]] = [None]
+    start: List[Optional[float]] = [None]
+    senders = [
+        asyncio.ensure_future(_replay_probe(url, api_key, queue, t0, start, speed, stats))
+        for key, keys in api_keys.items()
+        for api_key, queue in zip(keys, queues[key])
+    ]
+
+    t_end = None
+    unknown = 0
+    it = samples()
+    while True:
+        # 同步数据源放到线程里读，避免阻塞发送端的计时
+        batch = await asyncio.to_thread(_take, it, READ_BATCH)
+        if not batch:
+            break
+        for sample in batch:
+            t = _epoch(sample["timestamp"])
+            if t0[0] is None:
+                t0[0], start[0] = t, time.perf_counter()
+            t_end = t
+            targets = queues.get((sample["server_id"], sample["probe_id"]))
+            if targets is None:
+                unknown += 1
+                continue
+            for queue in targets:
+                await queue.put((t, sample["data"]))
+    for targets in queues.values():
+        for queue in targets:
+            await queue.put(None)
+
+    results = await asyncio.gather(*senders, return_exceptions=True)
+    elapsed = time.perf_counter() - start[0] if start[0] is not None else 0.0
+    latency = stats["latency"]
+    errors = collections.Counter(
+        f"{type(r).__name__}: {r}" for r in results if isinstance(r, BaseException)
+    )
+    return {
+        "probes": len(senders),
+        "samples": stats["count"],
+        "unknown_probe_samples": unknown,
+        "errors": sum(errors.values()),
+        # 按异常类型与消息聚合，便于定位失败原因
+        "error_details": dict(errors.most_common()),
+        "auth_failed": stats["auth_failed"],
+        "merged": stats["merged"],
+        "speed": speed,
+        "source_span_s": round(t_end - t0[0], 3) if t0[0] is not None else 0.0,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(stats["count"] / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(_percentile(latency, 50) * 1000, 2),
+            "p95": round(_percentile(latency, 95) * 1000, 2),
+            "p99": round(_percentile(latency, 99) * 1000, 2),
+            "max": round(stats["max_latency"] * 1000, 2),
+        },
+        # 发送晚于计划时间的秒数，持续增大说明控制面跟不上该倍速
+        "max_lag_s": round(stats["max_lag"], 3),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="回放历史指标到 /ws/probe 并统计耗时")
+    parser.add_argument("--url", default="ws://127.0.0.1:8000/ws/probe")
+    parser.add_argument("--api", help="目标控制面 REST 地址，默认由 --url 推出")
+    parser.add_argument("--input", help="按 timestamp 升序的 NDJSON；缺省时从数据库读取 Metric")
+    parser.add_argument("--export", help="只把数据库中的 Metric 导出为 NDJSON，不回放")
+    parser.add_argument("--server-id")
+    parser.add_argument("--since", type=dt.datetime.fromisoformat)
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--speed", type=float, default=1.0, help="倍速，0 表示不等待尽快发送")
+    parser.add_argument("--clones", type=int, default=1, help="每个历史探针扇出的模拟探针数")
+    parser.add_argument("--keep", action="store_true", help="回放后保留临时服务器与探针")
+    args = parser.parse_args(argv)
+
+    if args.export:
+        count = _export(_iter_db(args.server_id, args.since, args.limit), args.export)
+        print(f"[replay] exported {count} samples to {args.export}")
+        return
+
+    if args.input:
+        def samples() -> Iterator[Dict]:
+            return _iter_ndjson(args.input, args.server_id, args.since, args.limit)
+
+        # 先扫一遍只收集探针集合（内存与探针数成正比），用于预先创建模拟探针
+        keys = {(s["server_id"], s["probe_id"]) for s in samples()}
+    else:
+        def samples() -> Iterator[Dict]:
+            return _iter_db(args.server_id, args.since, args.limit)
+
+        keys = _db_keys(args.server_id, args.since, args.limit)
+
+    clones = max(args.clones, 1)
+    api_base = args.api or _api_base(args.url)
+    api_keys, server_ids = _provision(api_base, keys, clones)
+    print(
+        f"[replay] {len(keys) * clones} probes on {len(server_ids)} servers -> {args.url} "
+        f"speed={args.speed}x"
+    )
+    try:
+        report = asyncio.run(replay(args.url, samples, api_keys, args.speed))
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    finally:
+        if args.keep:
+            print(f"[replay] kept servers: {' '.join(server_ids)}")
+        else:
+            _teardown(api_base, server_ids)
+            print(f"[replay] removed {len(server_ids)} replay servers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import datetime as dt
+from typing import Dict, List, Optional, Tuple
+
+
+class IngestAggregator:
+    """按服务器 + 时间桶对同一台服务器上多个探针的上报去重。
+
+    合并规则：同一时间桶内，不同探针的样本视为同一台主机的重复测量，
+    以最后到达的探针的完整样本为准（整份替换，不按字段拼接），并更新同一行的
+    ``probe_id``；``probes`` 记录该桶内所有贡献过的探针。
+    同一探针在桶内再次上报说明它的上报间隔小于桶宽，此时开启新的一行，不丢历史。
+
+    时间戳统一为 naive UTC。
+    """
+
+    def __init__(self, bucket_seconds: float) -> None:
+        self.bucket_seconds = bucket_seconds
+        # server_id -> {"bucket", "metric_id", "probe_id", "data", "timestamp", "probes", "dirty"}
+        self._buckets: Dict[str, Dict] = {}
+
+    def _bucket_of(self, ts: dt.datetime) -> int:
+        return int(ts.replace(tzinfo=dt.timezone.utc).timestamp() // self.bucket_seconds)
+
+    def offer(
+        self, server_id: str, probe_id: str, ts: dt.datetime, data: Dict
+    ) -> Tuple[str, Optional[Dict], Optional[Dict]]:
+        """登记一条样本，返回 (动作, 当前桶状态, 被取代且尚未推送的旧桶)。
+
+        动作为 ``new``（开新行）、``merge``（替换当前桶所在行）
+        或 ``late``（早于当前桶的迟到样本，只落库不覆盖最新状态）。
+        """
+        current = self._buckets.get(server_id)
+        if self.bucket_seconds <= 0:
+            bucket = None
+        else:
+            bucket = self._bucket_of(ts)
+            if current is not None and bucket < current["bucket"]:
+                return "late", None, None
+        if (
+            current is None
+            or bucket is None
+            or bucket > current["bucket"]
+            or probe_id in current["probes"]
+        ):
+            state = {
+                "bucket": bucket,
+                "metric_id": None,
+                "probe_id": probe_id,
+                "data": data,
+                "timestamp": ts,
+                "probes": [probe_id],
+                "dirty": True,
+            }
+            self._buckets[server_id] = state
+            closed = current if current is not None and current["dirty"] else None
+            return "new", state, closed
+        current["probe_id"] = probe_id
+        current["data"] = data
+        current["timestamp"] = max(current["timestamp"], ts)
+        current["probes"].append(probe_id)
+        current["dirty"] = True
+        return "merge", current, None
+
+    def bucket_end(self, state: Dict) -> Optional[dt.datetime]:
+        """桶的结束时间（naive UTC）；未启用分桶时返回 None。"""
+        if state["bucket"] is None:
+            return None
+        end = (state["bucket"] + 1) * self.bucket_seconds
+        return dt.datetime.fromtimestamp(end, dt.timezone.utc).replace(tzinfo=None)
+
+    def discard(self, server_id: str) -> None:
+        self._buckets.pop(server_id, None)
+
+    def current(self, server_id: str) -> Optional[Dict]:
+        return self._buckets.get(server_id)
+
+    def take(self, state: Dict) -> bool:
+        """若桶有未推送的变更则标记为已推送并返回 True，保证每次变更只推送一次。"""
+        if not state["dirty"]:
+            return False
+        state["dirty"] = False
+        return True
+
+    def probes(self, server_id: str) -> List[str]:
+        current = self._buckets.get(server_id)
+        return list(current["probes"]) if current else []
@@ -1,50 +1,180 @@
+import asyncio
 import datetime as dt
-from typing import Dict, Optional
+import os
+import time
+from typing import Dict, Optional, Set, Tuple
 
 from fastapi import Depends, WebSocket, WebSocketDisconnect
 from sqlalchemy.orm import Session
 
 from backend.database.db import get_db
 from backend.models.models import Metric, Probe
+from backend.websocket.aggregator import IngestAggregator
 from backend.websocket.manager import ConnectionManager
+from backend.websocket.summary import FleetSummary
 
 frontend_manager = ConnectionManager()
-# 简单缓存最近一次指标，前端新连接时可立即看到
+# 简单缓存最近一次指标，前端新连接时可立即看到（按服务器去重后的视图）
 latest_state: Dict[str, Dict] = {}
+# server_id -> {probe_id: 最近一次上报}，保留单探针视图；探针断开时清理
+probe_state: Dict[str, Dict[str, Dict]] = {}
+# server_id -> 当前在线的探针 id
+connected_probes: Dict[str, Set[str]] = {}
+# 同一服务器多个探针在同一时间桶内的上报去重为一行、一次广播
+aggregator = IngestAggregator(float(os.getenv("INGEST_BUCKET_SECONDS", "5")))
+# 服务器在线状态与全局版本号；超过 SERVER_ONLINE_SECONDS 秒未上报视为离线
+fleet = FleetSummary(float(os.getenv("SERVER_ONLINE_SECONDS", "30")))
 
 
-async def _handle_metrics(
-    payload: Dict, probe: Probe, websocket: WebSocket, db: Session
-) -> Optional[Metric]:
-    data = payload.get("data") or {}
-    timestamp = payload.get("timestamp")
-    ts = dt.datetime.fromisoformat(timestamp) if timestamp else dt.datetime.utcnow()
-    metric_row = Metric(
-        server_id=probe.server_id,
-        probe_id=probe.id,
-        timestamp=ts,
-        metrics_json=data,
+def _to_naive_utc(ts: dt.datetime) -> dt.datetime:
+    # 统一为 naive UTC，与服务端 utcnow() 可比较
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def _parse_timestamp(timestamp: Optional[str]) -> dt.datetime:
+    if not timestamp:
+        return dt.datetime.utcnow()
+    return _to_naive_utc(dt.datetime.fromisoformat(timestamp.replace("Z", "+00:00")))
+
+
+async def _push(server_id: str, bucket: Dict) -> None:
+    """把桶内去重后的样本推送给前端；每个桶的每次变更只推送一次。"""
+    if not aggregator.take(bucket):
+        return
+    await frontend_manager.broadcast(
+        {
+            "type": "realtime_update",
+            "server_id": server_id,
+            "data": bucket["data"],
+            "timestamp": bucket["timestamp"].isoformat(),
+        }
     )
-    db.add(metric_row)
-    probe.last_seen = dt.datetime.utcnow()
-    db.commit()
-    db.refresh(metric_row)
-    latest_state[probe.server_id] = {
+
+
+async def _scheduled_push(server_id: str, bucket: Dict) -> None:
+    # 定时器已触发，之后再并入的样本需要重新排期
+    bucket["push_scheduled"] = False
+    await _push(server_id, bucket)
+
+
+def _schedule_push(server_id: str, bucket: Dict) -> None:
+    # 还有在线探针未上报：等桶结束时再合并推送
+    if bucket.get("push_scheduled"):
+        return
+    bucket["push_scheduled"] = True
+    delay = (aggregator.bucket_end(bucket) - dt.datetime.utcnow()).total_seconds()
+    delay = min(max(delay, 0.0), aggregator.bucket_seconds)
+    asyncio.get_running_loop().call_later(
+        delay, lambda: asyncio.ensure_future(_scheduled_push(server_id, bucket))
+    )
+
+
+def _record_probe_state(probe: Probe, ts: dt.datetime, data: Dict) -> None:
+    states = probe_state.setdefault(probe.server_id, {})
+    now = time.time()
+    states[probe.id] = {
+        "server_id": probe.server_id,
         "data": data,
         "timestamp": ts.isoformat(),
+        "received_at": now,
     }
-    await frontend_manager.broadcast(
-        {
-            "type": "realtime_update",
-            "server_id": probe.server_id,
-            "data": data,
-            "timestamp": ts.isoformat(),
+    # REST 上报的探针没有断开事件，超过在线窗口未再上报的条目在此清理
+    online = connected_probes.get(probe.server_id, set())
+    for pid in [
+        pid
+        for pid, state in states.items()
+        if pid not in online and now - state["received_at"] > fleet.online_seconds
+    ]:
+        del states[pid]
+
+
+async def ingest_sample(
+    probe: Probe, ts: Optional[dt.datetime], data: Dict, db: Session
+) -> Tuple[Metric, str]:
+    """WebSocket 与 REST 共用的入库路径：去重、落库、更新内存状态并推送。
+
+    返回 (Metric 行, 动作)，动作含义见 ``IngestAggregator.offer``。
+    """
+    ts = _to_naive_utc(ts) if ts is not None else dt.datetime.utcnow()
+    _record_probe_state(probe, ts, data)
+    action, bucket, closed = aggregator.offer(probe.server_id, probe.id, ts, data)
+
+    # 落库在任何 await 之前完成，避免并发探针看到尚未绑定行的桶
+    metric_row = None
+    if action == "merge" and bucket["metric_id"] is not None:
+        metric_row = db.get(Metric, bucket["metric_id"])
+    if metric_row is not None:
+        # JSON 列需要整体赋值才能被识别为变更
+        metric_row.metrics_json = bucket["data"]
+        metric_row.timestamp = bucket["timestamp"]
+        metric_row.probe_id = probe.id
+    else:
+        metric_row = Metric(
+            server_id=probe.server_id,
+            probe_id=probe.id,
+            timestamp=ts,
+            metrics_json=data,
+        )
+        db.add(metric_row)
+    probe.last_seen = dt.datetime.utcnow()
+    db.commit()
+    db.refresh(metric_row)
+    fleet.touch(probe.server_id)
+
+    if action != "late":
+        bucket["metric_id"] = metric_row.id
+        latest_state[probe.server_id] = {
+            "data": bucket["data"],
+            "timestamp": bucket["timestamp"].isoformat(),
+            "probes": list(bucket["probes"]),
         }
+    if closed is not None:
+        await _push(probe.server_id, closed)
+    if action != "late":
+        online = connected_probes.get(probe.server_id, set())
+        if bucket["bucket"] is None or online <= set(bucket["probes"]):
+            # 所有在线探针都已上报，桶已完整，立即推送
+            await _push(probe.server_id, bucket)
+        else:
+            _schedule_push(probe.server_id, bucket)
+    return metric_row, action
+
+
+async def _handle_metrics(
+    payload: Dict, probe: Probe, websocket: WebSocket, db: Session
+) -> Optional[Metric]:
+    data = payload.get("data") or {}
+    ts = _parse_timestamp(payload.get("timestamp"))
+    metric_row, action = await ingest_sample(probe, ts, data, db)
+    await websocket.send_json(
+        {"type": "ack", "timestamp": ts.isoformat(), "merged": action == "merge"}
     )
-    await websocket.send_json({"type": "ack", "timestamp": ts.isoformat()})
     return metric_row
 
 
+def forget_server(server_id: str) -> None:
+    """服务器被删除后清理它在内存中的全部状态。"""
+    latest_state.pop(server_id, None)
+    probe_state.pop(server_id, None)
+    aggregator.discard(server_id)
+    fleet.forget(server_id)
+
+
+def _release_probe(probe: Probe) -> None:
+    online = connected_probes.get(probe.server_id)
+    if online is not None:
+        online.discard(probe.id)
+        if not online:
+            del connected_probes[probe.server_id]
+    states = probe_state.get(probe.server_id)
+    if states is not None:
+        states.pop(probe.id, None)
+        if not states:
+            del probe_state[probe.server_id]
+
+
 async def probe_socket(websocket: WebSocket, db: Session = Depends(get_db)):
     await websocket.accept()
     probe: Optional[Probe] = None
@@ -59,6 +189,7 @@ async def probe_socket(websocket: WebSocket, db: Session = Depends(get_db)):
             await websocket.send_json({"error": "invalid api_key"})
             await websocket.close(code=4003)
             return
+        connected_probes.setdefault(probe.server_id, set()).add(probe.id)
         await websocket.send_json({"type": "auth_ok", "probe_id": probe.id})
         while True:
             message = await websocket.receive_json()
@@ -71,6 +202,9 @@ async def probe_socket(websocket: WebSocket, db: Session = Depends(get_db)):
         return
     except Exception:
         await websocket.close(code=1011)
+    finally:
+        if probe is not None:
+            _release_probe(probe)
 
 
 async def dashboard_socket(websocket: WebSocket):
@@ -0,0 +1,59 @@
+import datetime as dt
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+
+class FleetSummary:
+    """内存中的服务器在线汇总与版本号。
+
+    ``version`` 只在服务器增改时递增；每台服务器另有自己的版本号，随该服务器的上报递增。
+    REST 轮询的 ETag 由页面上各服务器的版本与状态组成，其他服务器上报不会使其失效。
+    启动时从 ``Probe.last_seen`` 播种，重启后离线的服务器仍显示为 offline 而不是 pending。
+    """
+
+    def __init__(self, online_seconds: float) -> None:
+        self.online_seconds = online_seconds
+        # 进程启动时间，参与 ETag，避免重启后版本号从 0 重新计数造成误命中
+        self.started = time.time()
+        self.version = 0
+        # server_id -> 最近一次上报的 epoch 秒
+        self._seen: Dict[str, float] = {}
+        # server_id -> 上报次数，作为单台服务器的版本号
+        self._versions: Dict[str, int] = {}
+
+    def seed(self, rows: Iterable[Tuple[str, Optional[dt.datetime]]]) -> None:
+        """以 (server_id, last_seen naive UTC) 播种，保留每台服务器最新的一次。"""
+        for server_id, last_seen in rows:
+            if last_seen is None:
+                continue
+            seen = last_seen.replace(tzinfo=dt.timezone.utc).timestamp()
+            if seen > self._seen.get(server_id, 0.0):
+                self._seen[server_id] = seen
+        self.version += 1
+
+    def touch(self, server_id: str, now: Optional[float] = None) -> None:
+        self._seen[server_id] = time.time() if now is None else now
+        self._versions[server_id] = self._versions.get(server_id, 0) + 1
+
+    def server_version(self, server_id: str) -> int:
+        return self._versions.get(server_id, 0)
+
+    def bump(self) -> None:
+        self.version += 1
+
+    def forget(self, server_id: str) -> None:
+        self._seen.pop(server_id, None)
+        self._versions.pop(server_id, None)
+        self.version += 1
+
+    def status(self, server_id: str, now: Optional[float] = None) -> str:
+        """online / offline / pending（从未上报）。"""
+        seen = self._seen.get(server_id)
+        if seen is None:
+            return "pending"
+        now = time.time() if now is None else now
+        return "online" if now - seen <= self.online_seconds else "offline"
+
+    def online_cutoff(self) -> dt.datetime:
+        """与 ``status`` 一致的数据库侧在线判定：last_seen 不早于该时间（naive UTC）。"""
+        return dt.datetime.utcnow() - dt.timedelta(seconds=self.online_seconds)
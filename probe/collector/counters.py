@@ -0,0 +1,46 @@
+import time
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+
+def counter_delta(prev: int, curr: int) -> int:
+    """计算单调计数器的增量，处理回绕与重置。
+
+    回绕由 psutil 的 ``nowrap=True``（默认）在进程内累加修正，32 位计数器与
+    /proc/diskstats 字段回绕后读数依旧单调；修正后仍出现的回退只可能是重置
+    （网卡重建、驱动重载），本轮没有可信的增量，返回 0。
+    """
+    if curr < prev:
+        return 0
+    return curr - prev
+
+
+class CounterStore:
+    """按 key 保存上一次的计数器快照，用于计算速率。
+
+    每个 key 只保存 (时间, 计数元组)，消失的 key 会在下一次 ``prune`` 时清理。
+    """
+
+    __slots__ = ("_last",)
+
+    def __init__(self) -> None:
+        self._last: Dict[str, Tuple[float, Tuple[int, ...]]] = {}
+
+    def rates(
+        self, key: str, values: Sequence[int], now: Optional[float] = None
+    ) -> Tuple[float, ...]:
+        """记录新快照并返回各计数器每秒增量；首次出现的 key 返回全 0。"""
+        now = time.time() if now is None else now
+        values = tuple(values)
+        prev = self._last.get(key)
+        self._last[key] = (now, values)
+        if prev is None or len(prev[1]) != len(values):
+            return (0.0,) * len(values)
+        interval = max(now - prev[0], 1e-3)
+        return tuple(counter_delta(p, c) / interval for p, c in zip(prev[1], values))
+
+    def prune(self, prefix: str, keys: Iterable[str]) -> None:
+        """清理以 ``prefix`` 开头且已不存在的 key，避免虚拟网卡反复创建导致无界增长。"""
+        alive = set(keys)
+        for key in list(self._last):
+            if key.startswith(prefix) and key not in alive:
+                del self._last[key]
@@ -1,10 +1,43 @@
+import fnmatch
 import socket
 import time
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional
 
 import netifaces
 import psutil
 
+from probe.collector.counters import CounterStore
+
+
+class InterfaceFilter:
+    """限制上报的网卡：包含/排除通配符 + 数量上限（按流量取前 N 个）。"""
+
+    def __init__(
+        self,
+        include: Optional[List[str]] = None,
+        exclude: Optional[List[str]] = None,
+        limit: int = 16,
+    ) -> None:
+        self.include = include or ["*"]
+        self.exclude = exclude or []
+        self.limit = limit
+
+    @classmethod
+    def from_string(cls, include: str, exclude: str, limit: int) -> "InterfaceFilter":
+        def split(value: str) -> List[str]:
+            return [item.strip() for item in value.split(",") if item.strip()]
+
+        return cls(split(include), split(exclude), limit)
+
+    def match(self, name: str) -> bool:
+        if any(fnmatch.fnmatchcase(name, pat) for pat in self.exclude):
+            return False
+        return any(fnmatch.fnmatchcase(name, pat) for pat in self.include)
+
+
+_counters = CounterStore()
+_default_filter = InterfaceFilter(exclude=["lo"])
+
 
 def _vpn_process_running() -> Dict[str, bool]:
     names = {"openvpn": False, "wireguard": False}
@@ -34,11 +67,62 @@ def _default_gateway_interface() -> Optional[str]:
     return iface[1] if iface else None
 
 
-def collect_metrics() -> Dict:
+def _interface_metrics(iface_filter: InterfaceFilter, now: float) -> Dict[str, Dict]:
+    pernic = psutil.net_io_counters(pernic=True)
+    items = []
+    for name, nic in pernic.items():
+        if not iface_filter.match(name):
+            continue
+        (tx_rate, rx_rate, tx_pps, rx_pps, err_in, err_out, drop_in, drop_out) = (
+            _counters.rates(
+                f"nic:{name}",
+                (
+                    nic.bytes_sent,
+                    nic.bytes_recv,
+                    nic.packets_sent,
+                    nic.packets_recv,
+                    nic.errin,
+                    nic.errout,
+                    nic.dropin,
+                    nic.dropout,
+                ),
+                now,
+            )
+        )
+        items.append(
+            (
+                name,
+                {
+                    "bytes_sent": nic.bytes_sent,
+                    "bytes_recv": nic.bytes_recv,
+                    "tx_rate": tx_rate,  # bytes/s
+                    "rx_rate": rx_rate,
+                    "tx_pps": tx_pps,
+                    "rx_pps": rx_pps,
+                    "errin": nic.errin,
+                    "errout": nic.errout,
+                    "dropin": nic.dropin,
+                    "dropout": nic.dropout,
+                    "err_rate": err_in + err_out,  # 每秒新增
+                    "drop_rate": drop_in + drop_out,
+                },
+            )
+        )
+    # 只保留仍存在且被选中的网卡快照
+    _counters.prune("nic:", [f"nic:{name}" for name, _ in items])
+    if iface_filter.limit > 0 and len(items) > iface_filter.limit:
+        # 网卡过多时按流量取前 N 个，保证上报帧大小有界
+        items.sort(key=lambda item: item[1]["rx_rate"] + item[1]["tx_rate"], reverse=True)
+        items = items[: iface_filter.limit]
+    return dict(sorted(items))
+
+
+def collect_metrics(iface_filter: Optional[InterfaceFilter] = None) -> Dict:
     cpu = psutil.cpu_percent(interval=0.2)
     memory = psutil.virtual_memory().percent
     disk = psutil.disk_usage("/").percent
     net = psutil.net_io_counters()
+    disk_io = psutil.disk_io_counters()
     hostname = socket.gethostname()
 
     iface = _default_gateway_interface()
@@ -53,30 +137,15 @@ def collect_metrics() -> Dict:
 
     vpn_state = _vpn_process_running()
 
-    # 速率计算：以进程内静态缓存保存上次计数与时间
+    # 速率计算：以模块级计数器快照保存上次计数与时间
     now = time.time()
-    if not hasattr(collect_metrics, "_last"):
-        collect_metrics._last = {
-            "time": now,
-            "bytes_sent": net.bytes_sent,
-            "bytes_recv": net.bytes_recv,
-            "disk_read": psutil.disk_io_counters().read_bytes,
-            "disk_write": psutil.disk_io_counters().write_bytes,
-        }
-    last = collect_metrics._last
-    interval = max(now - last["time"], 1e-3)
-    net_sent_rate = max(net.bytes_sent - last["bytes_sent"], 0) / interval
-    net_recv_rate = max(net.bytes_recv - last["bytes_recv"], 0) / interval
-    disk_io = psutil.disk_io_counters()
-    disk_read_rate = max(disk_io.read_bytes - last["disk_read"], 0) / interval
-    disk_write_rate = max(disk_io.write_bytes - last["disk_write"], 0) / interval
-    collect_metrics._last = {
-        "time": now,
-        "bytes_sent": net.bytes_sent,
-        "bytes_recv": net.bytes_recv,
-        "disk_read": disk_io.read_bytes,
-        "disk_write": disk_io.write_bytes,
-    }
+    net_sent_rate, net_recv_rate = _counters.rates(
+        "net", (net.bytes_sent, net.bytes_recv), now
+    )
+    disk_read_rate, disk_write_rate = _counters.rates(
+        "disk", (disk_io.read_bytes, disk_io.write_bytes), now
+    )
+    interfaces = _interface_metrics(iface_filter or _default_filter, now)
 
     return {
         "cpu": cpu,
@@ -89,6 +158,7 @@ def collect_metrics() -> Dict:
             "rx_rate": net_recv_rate,
             "iface": iface,
             "ip": ip_addr,
+            "interfaces": interfaces,
         },
         "disk_io": {
             "read_bytes": disk_io.read_bytes,
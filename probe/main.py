@@ -1,8 +1,9 @@
 import asyncio
 import os
+from functools import partial
 
 from probe.client.ws import run_probe
-from probe.collector.system import collect_metrics
+from probe.collector.system import InterfaceFilter, collect_metrics
 
 
 def load_env() -> dict:
@@ -11,11 +12,17 @@ def load_env() -> dict:
         "API_KEY": os.getenv("PROBE_API_KEY", "changeme"),
         "SERVER_ID": os.getenv("SERVER_ID", "server-uuid"),
         "INTERVAL": int(os.getenv("PROBE_INTERVAL", "5")),
+        "IFACES": os.getenv("PROBE_IFACES", "*"),
+        "IFACES_EXCLUDE": os.getenv("PROBE_IFACES_EXCLUDE", "lo"),
+        "IFACE_LIMIT": int(os.getenv("PROBE_IFACE_LIMIT", "16")),
     }
 
 
 def main():
     cfg = load_env()
+    iface_filter = InterfaceFilter.from_string(
+        cfg["IFACES"], cfg["IFACES_EXCLUDE"], cfg["IFACE_LIMIT"]
+    )
     print(
         f"[probe] connecting to {cfg['CONTROL_WS']} interval={cfg['INTERVAL']}s server={cfg['SERVER_ID']}"
     )
@@ -25,7 +32,7 @@ def main():
             api_key=cfg["API_KEY"],
             server_id=cfg["SERVER_ID"],
             interval=cfg["INTERVAL"],
-            collect_fn=collect_metrics,
+            collect_fn=partial(collect_metrics, iface_filter=iface_filter),
         )
     )
 